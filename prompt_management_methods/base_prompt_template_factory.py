@@ -13,12 +13,19 @@ from __future__ import annotations
 # 需要的该包中的其他工具。引入其他项目建议直接将2个文件都复制，再构建具体的prompt_template_factory，从而完全不修改这2个文件。
 from .prompt_template_loader import PromptTemplateLoader
 
+import asyncio
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 
 from typing import TYPE_CHECKING
 if TYPE_CHECKING:
+    from collections.abc import Callable
     from langchain.prompts import PromptTemplate, ChatPromptTemplate, HumanMessagePromptTemplate
 
+logger = logging.getLogger(__name__)
+
 
 class BasePromptTemplateFactory:
     """
@@ -38,10 +45,29 @@ class BasePromptTemplateFactory:
     封装:
         - 路径管理。不同的prompt文件树管理，默认使用2级文件夹层次化管理。
         - prompt加载。返回langchain可用的PromptTemplate。
+        - 缓存。相同的(prompt-templates-dir, name)返回同一对象，不重复构建。
+        - 预加载。可选。调用preload_prompt_templates，预先加载文件夹中所有的system和human message-prompt-template。
+
+    注意:
+        - 使用__slots__，不能设置未声明的属性。
+        - 派生类需要声明__slots__，新增属性写在其中，否则会重新引入__dict__。没有新增属性时声明 __slots__ = () 。
     """
+    __slots__ = (
+        'prompt_templates_dir',
+        'enable_prompt_caching',
+        '_chat_cache',
+        '_msg_cache',
+        '_prompt_cache',
+        '_dir_str',
+        '_dir_prefix',
+        '_sys_prefix',
+        '_human_prefix',
+    )
+
     def __init__(
         self,
         prompt_templates_dir: str | Path = None,
+        enable_prompt_caching: bool = False,
     ):
         """
         指定prompt-template文件存放的文件夹。
@@ -51,11 +77,19 @@ class BasePromptTemplateFactory:
 
         Args:
             prompt_templates_dir (Union[str, Path, None]): 存放prompt-template的文件夹的路径。
+            enable_prompt_caching (bool): safe_get_chat_prompt_template是否为system-message标记cache_control。
+                默认为False。仅在模型供应商支持prompt-caching时开启。
         """
         if prompt_templates_dir is None:
             self.prompt_templates_dir = Path(__file__).parent
         else:
             self.prompt_templates_dir = Path(prompt_templates_dir)
+        self.enable_prompt_caching = enable_prompt_caching
+        # 已构建的prompt-template的缓存。key为(prompt-templates-dir, name)。
+        self._chat_cache: dict[tuple[str, str], ChatPromptTemplate] = {}
+        self._msg_cache: dict[tuple[str, str], HumanMessagePromptTemplate] = {}
+        self._prompt_cache: dict[tuple[str, str], PromptTemplate] = {}
+        self._update_path_prefixes()
 
     # ====主要方法。====
     def get_chat_prompt_template(
@@ -69,6 +103,7 @@ class BasePromptTemplateFactory:
 
         注意:
             - 构建message-prompt-template时的命名，需要以 system_message_prompt_template_ 作为前缀。
+            - 返回缓存的副本。可以使用append和extend修改，不影响之后的调用。
 
         Args:
             system_message_prompt_template_name (str): strategy-patten封装对于message-prompt-template的获取。
@@ -76,17 +111,72 @@ class BasePromptTemplateFactory:
         Returns:
             ChatPromptTemplate: 可持续使用的chat-prompt-template。
         """
+        cache_key = (self._dir_str, system_message_prompt_template_name)
+        if cache_key in self._chat_cache:
+            return self._copy_chat_prompt_template(self._chat_cache[cache_key])
         # 处理路径。
-        system_message_prompt_template_path = (
-            self.prompt_templates_dir
-            # / 'system'  # 取消这行注释，修改和增加sub-dir。但默认不这样做。
-            / f"system_message_prompt_template_{system_message_prompt_template_name}.j2"
-        )
+        system_message_prompt_template_path = self._sys_prefix + system_message_prompt_template_name + '.j2'
         # 加载。
         chat_prompt_template = PromptTemplateLoader.load_chat_prompt_template_from_j2(
             system_message_prompt_template_path=system_message_prompt_template_path
         )
-        return chat_prompt_template
+        self._chat_cache[cache_key] = chat_prompt_template
+        return self._copy_chat_prompt_template(chat_prompt_template)
+
+    # ====主要方法。====
+    async def aget_chat_prompt_templates(
+        self,
+        system_message_prompt_template_names: list[str],
+    ) -> dict[str, ChatPromptTemplate]:
+        """
+        并发加载多个chat-prompt-template。
+
+        用于agent-system启动时一次获取多个chat-prompt-template。每个加载在线程中执行，文件读取可以并行。
+        已缓存的名称直接返回。重复的名称在并发前去重，只加载一次。
+
+        Args:
+            system_message_prompt_template_names (list[str]): 需要加载的system-message-prompt-template的名称。
+
+        Returns:
+            dict[str, ChatPromptTemplate]: 名称到chat-prompt-template的映射。
+        """
+        # 去重，避免同一名称在多个线程中同时加载。
+        system_message_prompt_template_names = list(dict.fromkeys(system_message_prompt_template_names))
+        chat_prompt_templates = await asyncio.gather(*(
+            asyncio.to_thread(self.get_chat_prompt_template, system_message_prompt_template_name)
+            for system_message_prompt_template_name in system_message_prompt_template_names
+        ))
+        return dict(zip(system_message_prompt_template_names, chat_prompt_templates))
+
+    # ====主要方法。====
+    def register_and_specialize(
+        self,
+        system_message_prompt_template_names: list[str],
+    ) -> dict[str, Callable[[], ChatPromptTemplate]]:
+        """
+        为固定的一组chat-prompt-template构建专用的获取方法。
+
+        用于agent-system启动时已知全部prompt的情况。注册时加载并缓存，
+        返回的方法已绑定路径和缓存key，调用时仅查询缓存，不经过get_chat_prompt_template的处理。
+
+        注意:
+            - 绑定注册时的prompt-templates-dir。之后调用set_sub_dir不影响已返回的方法。
+            - clear_cache后，首次调用会重新加载。
+            - 与get_chat_prompt_template相同，返回缓存的副本。
+
+        Args:
+            system_message_prompt_template_names (list[str]): 需要注册的system-message-prompt-template的名称。
+
+        Returns:
+            dict[str, Callable[[], ChatPromptTemplate]]: 名称到专用获取方法的映射。
+        """
+        chat_prompt_template_getters = {}
+        for system_message_prompt_template_name in system_message_prompt_template_names:
+            self.get_chat_prompt_template(system_message_prompt_template_name)
+            chat_prompt_template_getters[system_message_prompt_template_name] = self._make_chat_prompt_template_getter(
+                system_message_prompt_template_name=system_message_prompt_template_name,
+            )
+        return chat_prompt_template_getters
 
     # ====主要方法。====
     def safe_get_chat_prompt_template(
@@ -110,15 +200,12 @@ class BasePromptTemplateFactory:
             ChatPromptTemplate: 可持续使用的chat-prompt-template。
         """
         # 处理路径。
-        system_message_prompt_template_path = (
-            self.prompt_templates_dir
-            # / 'system'  # 取消这行注释，修改和增加sub-dir。但默认不这样做。
-            / f"system_message_prompt_template_{system_message_prompt_template_name}.j2"
-        )
+        system_message_prompt_template_path = self._sys_prefix + system_message_prompt_template_name + '.j2'
         # 加载。
         chat_prompt_template = PromptTemplateLoader.safe_load_chat_prompt_template_from_j2(
             system_message_prompt_template_path=system_message_prompt_template_path,
             system_message_prompt_template_format_kwargs=system_message_prompt_template_format_kwargs,
+            enable_prompt_caching=self.enable_prompt_caching,
         )
         return chat_prompt_template
 
@@ -134,6 +221,7 @@ class BasePromptTemplateFactory:
 
         注意:
             - 构建message-prompt-template时的命名，需要以 human_message_prompt_template_ 作为前缀。
+            - 返回缓存中共享的对象，不要原地修改。
 
         Args:
             message_prompt_template_name (str): strategy-patten封装对于message-prompt-template的获取。
@@ -141,16 +229,16 @@ class BasePromptTemplateFactory:
         Returns:
             HumanMessagePromptTemplate: 用于和agent对话的message-prompt-template。
         """
+        cache_key = (self._dir_str, message_prompt_template_name)
+        if cache_key in self._msg_cache:
+            return self._msg_cache[cache_key]
         # 处理路径。
-        human_message_prompt_template_path = (
-            self.prompt_templates_dir
-            # / 'message'  # 取消这行注释，修改和增加sub-dir。但默认不这样做。
-            / f"human_message_prompt_template_{message_prompt_template_name}.j2"
-        )
+        human_message_prompt_template_path = self._human_prefix + message_prompt_template_name + '.j2'
         # 加载。
         message_prompt_template = PromptTemplateLoader.load_human_message_prompt_template_from_j2(
             human_message_prompt_template_path=human_message_prompt_template_path,
         )
+        self._msg_cache[cache_key] = message_prompt_template
         return message_prompt_template
 
     # ====冗余方法。====
@@ -163,6 +251,7 @@ class BasePromptTemplateFactory:
 
         使用我已经构建的加载工具。配套方法，封装原始工具为strategy-pattern。
         这个方法会直接操作字符串，少数情况可能使用。
+        返回缓存中共享的对象，不要原地修改。
 
         Args:
             prompt_template_name (str): prompt-template的名字。不含扩展名，约定指定为j2文件。
@@ -175,10 +264,29 @@ class BasePromptTemplateFactory:
                     - invoke
                     - format
         """
-        prompt_template_path = self.prompt_templates_dir / f"{prompt_template_name}.j2"
+        cache_key = (self._dir_str, prompt_template_name)
+        if cache_key in self._prompt_cache:
+            return self._prompt_cache[cache_key]
+        prompt_template_path = self._dir_prefix + prompt_template_name + '.j2'
         prompt_template = PromptTemplateLoader.load_prompt_template_from_j2(prompt_template_path=prompt_template_path)
+        self._prompt_cache[cache_key] = prompt_template
         return prompt_template
 
+    # ====控制方法。====
+    def clear_cache(self) -> None:
+        """
+        清空该对象和PromptTemplateLoader中已构建的prompt-template的缓存。
+
+        该对象的缓存不检查文件是否修改。在运行中修改了prompt-template文件，需要调用该方法重新加载。
+
+        Returns:
+            None: 直接清空缓存。
+        """
+        self._chat_cache.clear()
+        self._msg_cache.clear()
+        self._prompt_cache.clear()
+        PromptTemplateLoader.clear_cache()
+
     # ====控制方法。派生类最多在构造方法中调用一次。====
     def set_sub_dir(
         self,
@@ -205,5 +313,129 @@ class BasePromptTemplateFactory:
         """
         sub_dir = Path(sub_dir)
         self.prompt_templates_dir = self.prompt_templates_dir / sub_dir
-        print(f"set prompt-template-dir to {self.prompt_templates_dir}")
+        logger.debug("set prompt-template-dir to %s", self.prompt_templates_dir)
+        self._update_path_prefixes()
+
+    # ====内部方法。====
+    @staticmethod
+    def _copy_chat_prompt_template(
+        chat_prompt_template: ChatPromptTemplate,
+    ) -> ChatPromptTemplate:
+        """
+        复制缓存中的chat-prompt-template。
+
+        ChatPromptTemplate的append和extend会原地修改messages。复制messages的list，调用者的修改不会影响缓存。
+        其中的message-prompt-template仍是共享的对象。
+
+        Args:
+            chat_prompt_template (ChatPromptTemplate): 缓存中的chat-prompt-template。
+
+        Returns:
+            ChatPromptTemplate: 拥有独立messages的副本。
+        """
+        return chat_prompt_template.model_copy(update={'messages': list(chat_prompt_template.messages)})
+
+    # ====内部方法。====
+    def _make_chat_prompt_template_getter(
+        self,
+        system_message_prompt_template_name: str,
+    ) -> Callable[[], ChatPromptTemplate]:
+        """
+        构建绑定了路径和缓存key的chat-prompt-template获取方法。
+
+        Args:
+            system_message_prompt_template_name (str): system-message-prompt-template的名称。
+
+        Returns:
+            Callable[[], ChatPromptTemplate]: 无参数的获取方法。
+        """
+        cache_key = (self._dir_str, system_message_prompt_template_name)
+        system_message_prompt_template_path = self._sys_prefix + system_message_prompt_template_name + '.j2'
+        chat_cache = self._chat_cache
+        copy_chat_prompt_template = self._copy_chat_prompt_template
+
+        def get_chat_prompt_template() -> ChatPromptTemplate:
+            chat_prompt_template = chat_cache.get(cache_key)
+            if chat_prompt_template is None:
+                # 缓存被清空后，从绑定的路径重新加载。
+                chat_prompt_template = PromptTemplateLoader.load_chat_prompt_template_from_j2(
+                    system_message_prompt_template_path=system_message_prompt_template_path,
+                )
+                chat_cache[cache_key] = chat_prompt_template
+            return copy_chat_prompt_template(chat_prompt_template)
+
+        return get_chat_prompt_template
+
+    # ====内部方法。====
+    def _update_path_prefixes(self) -> None:
+        """
+        预先计算prompt-templates-dir的字符串，以及prompt-template、system和human message-prompt-template路径的前缀。
+
+        prompt-templates-dir和前缀在调用之间不变，get方法中仅需拼接字符串，不用每次构建Path。
+        prompt-templates-dir变化时需要重新调用。
+
+        Returns:
+            None: 直接修改该类实例化对象的属性。
+        """
+        self._dir_str = os.fspath(self.prompt_templates_dir)
+        self._dir_prefix = self._dir_str + os.sep
+        self._sys_prefix = str(
+            self.prompt_templates_dir
+            # / 'system'  # 取消这行注释，修改和增加sub-dir。但默认不这样做。
+            / 'system_message_prompt_template_'
+        )
+        self._human_prefix = str(
+            self.prompt_templates_dir
+            # / 'message'  # 取消这行注释，修改和增加sub-dir。但默认不这样做。
+            / 'human_message_prompt_template_'
+        )
+
+    # ====控制方法。在prompt-templates-dir确定后，最多调用一次。====
+    def preload_prompt_templates(self) -> None:
+        """
+        预加载prompt-templates-dir中所有的system和human message-prompt-template。
+
+        一次扫描文件夹，并发读取和构建，结果直接写入缓存。之后的get_chat_prompt_template和get_message_prompt_template仅查询缓存。
+
+        使用情况:
+            - 长期运行的agent-system，在启动时一次加载全部prompt-template。
+            - 派生类在构造方法中调用set_sub_dir之后调用。不适合每次请求都构建的factory。
+
+        注意:
+            - 仅处理以 system_message_prompt_template_ 和 human_message_prompt_template_ 为前缀的j2文件。
+            - 文件夹不存在时不做任何处理，错误在具体加载时抛出。
+            - 单个文件加载失败时仅记录warning，不影响其他文件。错误在调用对应的get方法时抛出。
+
+        Returns:
+            None: 直接写入该对象的缓存。
+        """
+        if not self.prompt_templates_dir.is_dir():
+            return
+        with os.scandir(self.prompt_templates_dir) as entries:
+            file_names = [entry.name for entry in entries if entry.is_file() and entry.name.endswith('.j2')]
+        system_message_prompt_template_names = [
+            file_name[len('system_message_prompt_template_'):-len('.j2')]
+            for file_name in file_names
+            if file_name.startswith('system_message_prompt_template_')
+        ]
+        human_message_prompt_template_names = [
+            file_name[len('human_message_prompt_template_'):-len('.j2')]
+            for file_name in file_names
+            if file_name.startswith('human_message_prompt_template_')
+        ]
+        if not system_message_prompt_template_names and not human_message_prompt_template_names:
+            return
+        with ThreadPoolExecutor(max_workers=8) as executor:
+            futures = {
+                executor.submit(self.get_chat_prompt_template, name): f"system_message_prompt_template_{name}.j2"
+                for name in system_message_prompt_template_names
+            }
+            futures.update({
+                executor.submit(self.get_message_prompt_template, name): f"human_message_prompt_template_{name}.j2"
+                for name in human_message_prompt_template_names
+            })
+        for future, file_name in futures.items():
+            error = future.exception()
+            if error is not None:
+                logger.warning("failed to preload %s from %s: %r", file_name, self._dir_str, error)
 
@@ -20,24 +20,150 @@
             - 强制要求input_variables，但是签名和from_template中不一样。不清楚这样设计的原因。
             - 无法指定utf-8编码，中文文件会出现问题。
         因此，message_prompt_template为我使用pathlib修改的方法。不使用from_template_file，而是封装了from_template。
+    - 缓存:
+        同一路径的文件在未修改时，加载结果相同。以(类型, 绝对路径)为key缓存已加载的prompt-template和其mtime，
+        避免重复的文件读取和jinja2解析。文件修改后mtime变化，会自动重新加载，并替换旧的缓存。
+        需要强制重新加载时，使用PromptTemplateLoader.clear_cache。
+        缓存返回的是同一个对象，所有调用者共享，不要原地修改。需要修改时使用partial或model_copy得到新对象。
+        注意，BasePromptTemplateFactory在此之上有自己的缓存，不检查mtime，不会自动重新加载，需要调用其clear_cache。
+    - 延迟导入langchain_core:
+        langchain_core的导入很慢。仅使用load_original_txt时不需要langchain_core，因此在具体方法中导入。
+    - 为什么不使用共享的jinja2.Environment:
+        jinja2的解析和渲染由langchain_core内部完成，langchain_core每次会构建自己的SandboxedEnvironment，
+        没有可以注入Environment的接口。替换langchain_core中的formatter会失去sandbox保护，并依赖其内部实现。
+        以上的缓存只节省了加载时的文件读取，以及识别input_variables时的jinja2解析。
+        每次format或invoke时，langchain_core仍会使用新的SandboxedEnvironment重新解析并渲染模板，这部分无法在这里缓存。
+        同样的原因，也不使用jinja2.FileSystemBytecodeCache跨进程保存编译结果:
+        bytecode-cache只对Environment.get_template加载的模板生效，而langchain_core使用from_string，不会读取或写入bytecode-cache。
 """
 
 from __future__ import annotations
 
-from langchain_core.prompts import PromptTemplate
-from langchain_core.prompts import (
-    ChatPromptTemplate,
-    MessagesPlaceholder,
-    SystemMessagePromptTemplate,
-    HumanMessagePromptTemplate,
-    AIMessagePromptTemplate,
-)
+import mmap
+import os
+import threading
+from collections import OrderedDict
 from pathlib import Path
 
 from typing import TYPE_CHECKING, Annotated, Literal
 if TYPE_CHECKING:
+    from langchain_core.messages import SystemMessage
+    from langchain_core.prompts import (
+        BasePromptTemplate,
+        PromptTemplate,
+        ChatPromptTemplate,
+        SystemMessagePromptTemplate,
+        HumanMessagePromptTemplate,
+        AIMessagePromptTemplate,
+    )
     from langchain_core.prompts.chat import BaseMessagePromptTemplate
 
+# 超过该大小的文件使用mmap读取。
+_MMAP_THRESHOLD = 64 * 1024
+
+# 已加载的prompt-template的缓存。key为(类型, 绝对路径)，value为(mtime, prompt-template)。
+# 同一文件只保留最新的一份，文件修改后重新加载会直接替换。
+_TEMPLATE_CACHE: dict[tuple[str, str], tuple[int, BasePromptTemplate | BaseMessagePromptTemplate]] = {}
+
+# format后的system-message的LRU缓存。key为(id(system_message_prompt_template), 排序后的kwargs)。
+# value同时保存原本的system_message_prompt_template，保证缓存存在期间id不会被复用。
+_FORMAT_CACHE_MAX_SIZE = 256
+_FORMAT_CACHE: OrderedDict[tuple[int, tuple], tuple[SystemMessagePromptTemplate, SystemMessage]] = OrderedDict()
+# 多线程中使用同一个缓存，查询、更新和淘汰需要加锁。
+_FORMAT_CACHE_LOCK = threading.Lock()
+
+
+def _get_template_cache_key(
+    template_path: str | Path,
+    template_type: str,
+) -> tuple[tuple[str, str], int]:
+    """
+    构建_TEMPLATE_CACHE的key，并获取文件当前的mtime。
+
+    Args:
+        template_path (Union[str, Path]): prompt-template的路径。
+        template_type (str): 加载的prompt-template的类型。同一文件以不同类型加载，结果不同。
+
+    Returns:
+        tuple[tuple[str, str], int]: ((类型, 绝对路径), mtime)。
+    """
+    template_path = Path(template_path).resolve()
+    return (template_type, str(template_path)), template_path.stat().st_mtime_ns
+
+
+def _fast_read_text(
+    file_path: str | Path,
+) -> str:
+    """
+    以utf-8读取文件的全部文本。
+
+    prompt-template通常只有数KB。直接用os.read读取已知大小的内容，再一次性解码，
+    避免buffered text I/O的buffer分配和增量解码。
+    超过_MMAP_THRESHOLD的大文件使用mmap，直接从映射的内存解码，不产生中间的bytes。
+    换行符与Path.read_text的universal-newlines一致，统一转换为LF。
+
+    Args:
+        file_path (Union[str, Path]): 文件的路径。
+
+    Returns:
+        str: 读取的str文本。
+    """
+    flags = os.O_RDONLY | getattr(os, 'O_BINARY', 0)  # windows需要O_BINARY，读取原始bytes，换行符在解码后统一处理。
+    # O_NOATIME仅linux可用，并且要求是文件的所有者，否则os.open会报错。
+    if hasattr(os, 'O_NOATIME') and os.geteuid() == os.stat(file_path).st_uid:
+        flags |= os.O_NOATIME
+    fd = os.open(file_path, flags)
+    try:
+        size = os.fstat(fd).st_size
+        if size > _MMAP_THRESHOLD:
+            with mmap.mmap(fd, 0, access=mmap.ACCESS_READ) as mapped_file:
+                text = str(mapped_file, encoding='utf-8')
+        else:
+            data = os.read(fd, size)
+            # 单次read不保证读取完整，继续读取直到EOF。
+            while chunk := os.read(fd, 65536):
+                data += chunk
+            text = data.decode('utf-8')
+    finally:
+        os.close(fd)
+    # 与universal-newlines的行为一致。windows下checkout的文件可能是CRLF。
+    return text.replace('\r\n', '\n').replace('\r', '\n')
+
+
+def _format_system_message(
+    system_message_prompt_template: SystemMessagePromptTemplate,
+    format_kwargs: dict,
+) -> SystemMessage:
+    """
+    对system-message-prompt-template执行format，并缓存结果。
+
+    相同的system-message-prompt-template以相同的kwargs进行format，结果相同。
+    仅在kwargs的值全部是str时使用缓存。其他类型的相等和hash与format的结果不一定对应，
+    例如1、True、1.0相等但渲染不同，可变对象修改后hash不变。
+    返回缓存中的system-message的副本，避免下游的修改影响其他调用。
+
+    Args:
+        system_message_prompt_template (SystemMessagePromptTemplate): 需要format的system-message-prompt-template。
+        format_kwargs (dict): format操作的kwargs。
+
+    Returns:
+        SystemMessage: format后的system-message。
+    """
+    if not all(type(value) is str for value in format_kwargs.values()):
+        return system_message_prompt_template.format(**format_kwargs)
+    cache_key = (id(system_message_prompt_template), tuple(sorted(format_kwargs.items())))
+    with _FORMAT_CACHE_LOCK:
+        cached = _FORMAT_CACHE.get(cache_key)
+        if cached is not None:
+            _FORMAT_CACHE.move_to_end(cache_key)
+            return cached[1].model_copy(deep=True)
+    system_message = system_message_prompt_template.format(**format_kwargs)
+    with _FORMAT_CACHE_LOCK:
+        _FORMAT_CACHE[cache_key] = (system_message_prompt_template, system_message)
+        if len(_FORMAT_CACHE) > _FORMAT_CACHE_MAX_SIZE:
+            _FORMAT_CACHE.popitem(last=False)
+    return system_message.model_copy(deep=True)
+
 
 class PromptTemplateLoader:
     """
@@ -65,11 +191,17 @@ class PromptTemplateLoader:
         Returns:
             PromptTemplate: 可以进行langchain中相关操作的prompt-template。
         """
-        prompt_template = PromptTemplate.from_file(
-            template_file=prompt_template_path,
+        cache_key, mtime = _get_template_cache_key(prompt_template_path, 'prompt')
+        cached = _TEMPLATE_CACHE.get(cache_key)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        from langchain_core.prompts import PromptTemplate
+        template = _fast_read_text(prompt_template_path)
+        prompt_template = PromptTemplate.from_template(
+            template=template,
             template_format='jinja2',  # 需要指定，否则解析方式为f-string。
-            encoding='utf-8',  # 需要指定，否则解码中文有问题。
         )
+        _TEMPLATE_CACHE[cache_key] = (mtime, prompt_template)
         return prompt_template
 
     # ====主要方法。====
@@ -91,19 +223,15 @@ class PromptTemplateLoader:
             BaseMessagePromptTemplate: 具体的message-prompt-template。
                 实际上是Union[SystemMessagePromptTemplate, HumanMessagePromptTemplate, AIMessagePromptTemplate]。
                 langchain_core.prompts.chat中的源码实际是 _StringImageMessagePromptTemplate 。
+
+        Raises:
+            ValueError: message_type不是'system', 'human', 'ai'之一。
         """
-        if message_type == 'system':
-            return PromptTemplateLoader.load_system_message_prompt_template_from_j2(
-                system_message_prompt_template_path=message_prompt_template_path,
-            )
-        elif message_type == 'human':
-            return PromptTemplateLoader.load_human_message_prompt_template_from_j2(
-                human_message_prompt_template_path=message_prompt_template_path,
-            )
-        elif message_type == 'ai':
-            return PromptTemplateLoader.load_ai_message_prompt_template_from_j2(
-                ai_message_prompt_template_path=message_prompt_template_path,
-            )
+        try:
+            loader = PromptTemplateLoader._LOADERS[message_type]
+        except KeyError:
+            raise ValueError(f"unsupported message_type: {message_type!r}") from None
+        return loader(message_prompt_template_path)
 
     # ====主要方法。====
     @staticmethod
@@ -128,12 +256,13 @@ class PromptTemplateLoader:
         system_message_prompt_template = PromptTemplateLoader.load_system_message_prompt_template_from_j2(
             system_message_prompt_template_path=system_message_prompt_template_path,
         )
+        from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
         chat_prompt_template = ChatPromptTemplate.from_messages(
             messages=[
                 system_message_prompt_template,
                 MessagesPlaceholder(message_place_holder_key),
             ],
-            template_format='jinja2',
+            # 子项已是构建好的message-prompt-template或message，不需要指定template_format。
         )
         return chat_prompt_template
 
@@ -143,6 +272,7 @@ class PromptTemplateLoader:
         system_message_prompt_template_path: str | Path,
         system_message_prompt_template_format_kwargs: dict,
         message_place_holder_key: str = 'chat_history',
+        enable_prompt_caching: bool = False,
     ) -> ChatPromptTemplate:
         """
         加载预构建的llm-chain的system-prompt的部分。
@@ -158,6 +288,9 @@ class PromptTemplateLoader:
             message_place_holder_key (str, optional): 后续信息占位符key的命名。默认为'chat_history'。
                 参与构建llm-chain后，后续invoke仅传入messages即可。
                 对于MessagesPlaceholder可以进一步指定，但是因为并不常用，该方法并没有实现。
+            enable_prompt_caching (bool, optional): 是否为system-message标记cache_control。默认为False。
+                format后的system-message是固定的前缀，标记后可以使用模型供应商的prompt-caching。
+                content会变为content-block的list，需要确认使用的模型供应商支持。
 
         Returns:
             ChatPromptTemplate: 可使用invoke传递chat-history的chat-prompt-template。
@@ -166,16 +299,28 @@ class PromptTemplateLoader:
             system_message_prompt_template_path=system_message_prompt_template_path,
         )
         # system_message_prompt_template_format_kwargs为None时的兼容性处理。
-        if system_message_prompt_template_format_kwargs:
-            system_message = system_message_prompt_template.format(**system_message_prompt_template_format_kwargs)
-        else:
-            system_message = system_message_prompt_template.format()
+        system_message = _format_system_message(
+            system_message_prompt_template=system_message_prompt_template,
+            format_kwargs=system_message_prompt_template_format_kwargs or {},
+        )
+        if enable_prompt_caching:
+            from langchain_core.messages import SystemMessage
+            system_message = SystemMessage(
+                content=[
+                    {
+                        'type': 'text',
+                        'text': system_message.content,
+                        'cache_control': {'type': 'ephemeral'},
+                    },
+                ],
+            )
+        from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
         chat_prompt_template = ChatPromptTemplate.from_messages(
             messages=[
                 system_message,
                 MessagesPlaceholder(message_place_holder_key),
             ],
-            template_format='jinja2',
+            # 子项已是构建好的message-prompt-template或message，不需要指定template_format。
         )
         return chat_prompt_template
 
@@ -184,11 +329,17 @@ class PromptTemplateLoader:
     def load_system_message_prompt_template_from_j2(
         system_message_prompt_template_path: Annotated[str | Path, 'message-prompt-template所在的路径'],
     ) -> SystemMessagePromptTemplate:
-        template = Path(system_message_prompt_template_path).read_text(encoding='utf-8')
+        cache_key, mtime = _get_template_cache_key(system_message_prompt_template_path, 'system')
+        cached = _TEMPLATE_CACHE.get(cache_key)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        from langchain_core.prompts import SystemMessagePromptTemplate
+        template = _fast_read_text(system_message_prompt_template_path)
         system_message_prompt_template = SystemMessagePromptTemplate.from_template(
             template=template,
             template_format='jinja2',
         )
+        _TEMPLATE_CACHE[cache_key] = (mtime, system_message_prompt_template)
         return system_message_prompt_template
 
     # ====常用方法。====
@@ -196,11 +347,17 @@ class PromptTemplateLoader:
     def load_human_message_prompt_template_from_j2(
         human_message_prompt_template_path: Annotated[str | Path, 'message-prompt-template所在的路径'],
     ) -> HumanMessagePromptTemplate:
-        template = Path(human_message_prompt_template_path).read_text(encoding='utf-8')
+        cache_key, mtime = _get_template_cache_key(human_message_prompt_template_path, 'human')
+        cached = _TEMPLATE_CACHE.get(cache_key)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        from langchain_core.prompts import HumanMessagePromptTemplate
+        template = _fast_read_text(human_message_prompt_template_path)
         human_message_prompt_template = HumanMessagePromptTemplate.from_template(
             template=template,
             template_format='jinja2',
         )
+        _TEMPLATE_CACHE[cache_key] = (mtime, human_message_prompt_template)
         return human_message_prompt_template
 
     # ====为了完整性保留的方法。====
@@ -208,18 +365,48 @@ class PromptTemplateLoader:
     def load_ai_message_prompt_template_from_j2(
         ai_message_prompt_template_path: Annotated[str | Path, 'message-prompt-template所在的路径'],
     ) -> AIMessagePromptTemplate:
-        template = Path(ai_message_prompt_template_path).read_text(encoding='utf-8')
+        cache_key, mtime = _get_template_cache_key(ai_message_prompt_template_path, 'ai')
+        cached = _TEMPLATE_CACHE.get(cache_key)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+        from langchain_core.prompts import AIMessagePromptTemplate
+        template = _fast_read_text(ai_message_prompt_template_path)
         ai_message_prompt_template = AIMessagePromptTemplate.from_template(
             template=template,
             template_format='jinja2',
         )
+        _TEMPLATE_CACHE[cache_key] = (mtime, ai_message_prompt_template)
         return ai_message_prompt_template
 
+    # ====控制方法。====
+    @staticmethod
+    def clear_cache() -> None:
+        """
+        清空已加载的prompt-template，以及format后的system-message的缓存。
+
+        文件修改后会自动重新加载，一般不需要调用。
+        仅在需要强制重新加载，或释放内存时使用。
+
+        Returns:
+            None: 直接清空模块级别的缓存。
+        """
+        _TEMPLATE_CACHE.clear()
+        with _FORMAT_CACHE_LOCK:
+            _FORMAT_CACHE.clear()
+
+    # load_message_prompt_template_from_j2使用的映射。需要在具体的加载方法之后定义。
+    _LOADERS = {
+        'system': load_system_message_prompt_template_from_j2.__func__,
+        'human': load_human_message_prompt_template_from_j2.__func__,
+        'ai': load_ai_message_prompt_template_from_j2.__func__,
+    }
+
     # ====已弃用。旧的从指定路径加载prompt-template的方法。====
     @staticmethod
     def load_prompt_template_from_txt(
         prompt_template_path: str
     ) -> PromptTemplate:
+        from langchain_core.prompts import PromptTemplate
         prompt_template = PromptTemplate.from_file(
             template_file=prompt_template_path,
             template_format='f-string',
@@ -241,7 +428,6 @@ class PromptTemplateLoader:
         Returns:
             str: 读取的str文本。
         """
-        file_path = Path(file_path)
-        text = file_path.read_text(encoding='utf-8')
+        text = _fast_read_text(file_path)
         return text
 
@@ -8,16 +8,71 @@
 为什么不使用ChatPromptTemplate的add方法。
     - 不和system-prompt独立。
     - 如果进行过partial操作，langchain0.3并不会其进行处理。
+
+缓存:
+    - 以message-prompt-templates中各对象的id为key，缓存构建好的ChatPromptTemplate。
+    - 复用同一组message-prompt-template对象，仅改变format_kwargs时，不再重复构建ChatPromptTemplate。
+    - 仅在所有对象都是message-prompt-template时缓存。含有BaseMessage或tuple等的list通常每次都是新构建的，不会命中缓存。
 """
 
 from __future__ import annotations
 
+from langchain_core.messages import BaseMessage
 from langchain_core.prompts import ChatPromptTemplate
+from langchain_core.prompts.chat import BaseChatPromptTemplate
+from langchain_core.prompts.message import BaseMessagePromptTemplate
+
+import threading
+from collections import OrderedDict
+from collections.abc import Mapping
+
+# 可以直接format_messages的对象类型。其他ChatPromptTemplate可接受的类型，例如('human', 'hi')，需要由ChatPromptTemplate转换。
+_MESSAGE_PROMPT_TEMPLATE_TYPES = (BaseMessagePromptTemplate, BaseChatPromptTemplate)
+
+# 已构建的ChatPromptTemplate的LRU缓存。
+# value同时保存原本的对象，保证缓存存在期间这些对象不被回收，id不会被复用。
+_SAFE_FORMAT_CACHE_MAX_SIZE = 256
+_SAFE_FORMAT_CACHE: OrderedDict[
+    tuple[int, ...],
+    tuple[tuple[BaseMessagePromptTemplate | BaseMessage, ...], ChatPromptTemplate],
+] = OrderedDict()
+# 多线程中使用同一个缓存，查询、更新和淘汰需要加锁。
+_SAFE_FORMAT_CACHE_LOCK = threading.Lock()
+
+
+def _get_chat_prompt_template(
+    message_prompt_templates: list[BaseMessagePromptTemplate | BaseMessage],
+) -> ChatPromptTemplate:
+    """
+    构建ChatPromptTemplate。所有对象都是message-prompt-template时，使用缓存。
+
+    Args:
+        message_prompt_templates (list[BaseMessagePromptTemplate | BaseMessage]): 需要进行format的list。
 
-from typing import TYPE_CHECKING
-if TYPE_CHECKING:
-    from langchain_core.messages import BaseMessage
-    from langchain_core.prompts.message import BaseMessagePromptTemplate
+    Returns:
+        ChatPromptTemplate: 由message_prompt_templates构建的chat-prompt-template。
+    """
+    if not all(
+        isinstance(message_prompt_template, _MESSAGE_PROMPT_TEMPLATE_TYPES)
+        for message_prompt_template in message_prompt_templates
+    ):
+        return ChatPromptTemplate(
+            messages=message_prompt_templates,
+        )
+    cache_key = tuple(id(message_prompt_template) for message_prompt_template in message_prompt_templates)
+    with _SAFE_FORMAT_CACHE_LOCK:
+        cached = _SAFE_FORMAT_CACHE.get(cache_key)
+        if cached is not None:
+            _SAFE_FORMAT_CACHE.move_to_end(cache_key)
+            return cached[1]
+    chat_prompt_template = ChatPromptTemplate(
+        messages=message_prompt_templates,
+    )
+    with _SAFE_FORMAT_CACHE_LOCK:
+        _SAFE_FORMAT_CACHE[cache_key] = (tuple(message_prompt_templates), chat_prompt_template)
+        if len(_SAFE_FORMAT_CACHE) > _SAFE_FORMAT_CACHE_MAX_SIZE:
+            _SAFE_FORMAT_CACHE.popitem(last=False)
+    return chat_prompt_template
 
 
 def safe_format_message_prompt_template(
@@ -33,6 +88,11 @@ def safe_format_message_prompt_template(
         - 使用ChatPromptTemplate加载原本的MessagePromptTemplate和BaseMessage，进行变量识别，可以使用invoke方法。
         - 使用invoke方法，如果发生变量不匹配会报错。
         - 返回处理好的list。
+        - 所有的对象都不需要输入变量时，直接逐个format，不构建ChatPromptTemplate。
+
+    注意:
+        - 构建的ChatPromptTemplate以各对象的id缓存。复用同一组对象调用，才可以命中缓存。
+        - list中含有BaseMessage时不使用缓存。
 
     Args:
         message_prompt_templates (list[BaseMessagePromptTemplate | BaseMessage]): 需要进行format的list。
@@ -41,9 +101,25 @@ def safe_format_message_prompt_template(
     Returns:
         list[BaseMessage]: 处理好的list。
     """
-    chat_prompt_template = ChatPromptTemplate(
-        messages=message_prompt_templates,
-    )
+    # 没有需要输入的变量，不会发生变量不匹配，直接逐个处理。
+    # 其他情况，包括format_kwargs不是映射，交给ChatPromptTemplate处理和报错。
+    if isinstance(format_kwargs, Mapping) and all(
+        isinstance(message_prompt_template, BaseMessage)
+        or (
+            isinstance(message_prompt_template, _MESSAGE_PROMPT_TEMPLATE_TYPES)
+            and not message_prompt_template.input_variables
+        )
+        for message_prompt_template in message_prompt_templates
+    ):
+        messages = []
+        for message_prompt_template in message_prompt_templates:
+            if isinstance(message_prompt_template, BaseMessage):
+                messages.append(message_prompt_template)
+            else:
+                # 与ChatPromptTemplate的行为一致，传入全部的kwargs。
+                messages.extend(message_prompt_template.format_messages(**format_kwargs))
+        return messages
+    chat_prompt_template = _get_chat_prompt_template(message_prompt_templates)
     chat_prompt_value = chat_prompt_template.invoke(input=format_kwargs)
     messages = chat_prompt_value.to_messages()
     # assert all(isinstance(message, BaseMessage) for message in messages)
@@ -4,6 +4,41 @@
 
 from __future__ import annotations
 
+import pytest
+
+from prompt_management_methods import safe_format_message_prompt_template
+from prompt_management_methods.prompt_template_loader import PromptTemplateLoader
+
 from typing import TYPE_CHECKING
-# if TYPE_CHECKING:
+if TYPE_CHECKING:
+    from pathlib import Path
+
+
+@pytest.fixture(autouse=True)
+def clear_prompt_template_cache():
+    """
+    每个测试前后清空模块级别的缓存，避免测试之间相互影响。
+    """
+    PromptTemplateLoader.clear_cache()
+    yield
+    PromptTemplateLoader.clear_cache()
+
+
+@pytest.fixture(autouse=True)
+def clear_safe_format_cache():
+    """
+    每个测试前后清空safe_format_message_prompt_template的缓存。
+    """
+    safe_format_message_prompt_template._SAFE_FORMAT_CACHE.clear()
+    yield
+    safe_format_message_prompt_template._SAFE_FORMAT_CACHE.clear()
+
 
+@pytest.fixture
+def prompt_templates_dir(tmp_path: Path) -> Path:
+    """
+    存放prompt-template的临时文件夹。包含一个system和一个human message-prompt-template。
+    """
+    (tmp_path / 'system_message_prompt_template_agent.j2').write_text('你是{{ role }}。', encoding='utf-8')
+    (tmp_path / 'human_message_prompt_template_ask.j2').write_text('问题: {{ question }}', encoding='utf-8')
+    return tmp_path
@@ -0,0 +1,120 @@
+"""
+BasePromptTemplateFactory的测试。
+"""
+
+from __future__ import annotations
+
+import asyncio
+import logging
+
+import pytest
+
+from prompt_management_methods.base_prompt_template_factory import BasePromptTemplateFactory
+
+from typing import TYPE_CHECKING
+if TYPE_CHECKING:
+    from pathlib import Path
+
+
+class TestChatPromptTemplateCache:
+    def test_reuses_cached_messages(self, prompt_templates_dir: Path):
+        factory = BasePromptTemplateFactory(prompt_templates_dir)
+        first = factory.get_chat_prompt_template('agent')
+        second = factory.get_chat_prompt_template('agent')
+        assert second.messages[0] is first.messages[0]
+
+    def test_returned_template_can_be_extended(self, prompt_templates_dir: Path):
+        factory = BasePromptTemplateFactory(prompt_templates_dir)
+        factory.get_chat_prompt_template('agent').append(('human', '{{ question }}'))
+        assert len(factory.get_chat_prompt_template('agent').messages) == 2
+
+    def test_clear_cache(self, prompt_templates_dir: Path):
+        factory = BasePromptTemplateFactory(prompt_templates_dir)
+        first = factory.get_chat_prompt_template('agent')
+        factory.clear_cache()
+        assert factory.get_chat_prompt_template('agent').messages[0] is not first.messages[0]
+
+
+def test_get_message_prompt_template_is_cached(prompt_templates_dir: Path):
+    factory = BasePromptTemplateFactory(prompt_templates_dir)
+    assert factory.get_message_prompt_template('ask') is factory.get_message_prompt_template('ask')
+
+
+class TestPreload:
+    def test_construction_does_not_load(self, prompt_templates_dir: Path):
+        (prompt_templates_dir / 'system_message_prompt_template_broken.j2').write_text('{{ x ', encoding='utf-8')
+        factory = BasePromptTemplateFactory(prompt_templates_dir)
+        assert not factory._chat_cache
+
+    def test_broken_template_is_logged_and_raised_on_use(
+        self,
+        prompt_templates_dir: Path,
+        caplog: pytest.LogCaptureFixture,
+    ):
+        (prompt_templates_dir / 'system_message_prompt_template_broken.j2').write_text('{{ x ', encoding='utf-8')
+        factory = BasePromptTemplateFactory(prompt_templates_dir)
+        with caplog.at_level(logging.WARNING):
+            factory.preload_prompt_templates()
+        assert 'system_message_prompt_template_broken.j2' in caplog.text
+        assert (factory._dir_str, 'agent') in factory._chat_cache
+        assert (factory._dir_str, 'ask') in factory._msg_cache
+        with pytest.raises(Exception):
+            factory.get_chat_prompt_template('broken')
+
+    def test_missing_dir_is_skipped(self, tmp_path: Path):
+        factory = BasePromptTemplateFactory(tmp_path / 'missing')
+        factory.preload_prompt_templates()
+        assert not factory._chat_cache
+
+
+def test_set_sub_dir_updates_path_prefixes(prompt_templates_dir: Path):
+    sub_dir = prompt_templates_dir / 'sub'
+    sub_dir.mkdir()
+    (sub_dir / 'system_message_prompt_template_agent.j2').write_text('子文件夹{{ x }}', encoding='utf-8')
+    factory = BasePromptTemplateFactory(prompt_templates_dir)
+    assert factory.get_chat_prompt_template('agent').input_variables == ['chat_history', 'role']
+    factory.set_sub_dir('sub')
+    assert factory._sys_prefix == str(sub_dir / 'system_message_prompt_template_')
+    assert factory.get_chat_prompt_template('agent').input_variables == ['chat_history', 'x']
+
+
+def test_get_prompt_template(prompt_templates_dir: Path):
+    factory = BasePromptTemplateFactory(prompt_templates_dir)
+    prompt_template = factory.get_prompt_template('human_message_prompt_template_ask')
+    assert prompt_template.input_variables == ['question']
+    assert factory.get_prompt_template('human_message_prompt_template_ask') is prompt_template
+
+
+def test_aget_chat_prompt_templates_loads_duplicates_once(prompt_templates_dir: Path):
+    (prompt_templates_dir / 'system_message_prompt_template_critic.j2').write_text('你是{{ role }}。', encoding='utf-8')
+    factory = BasePromptTemplateFactory(prompt_templates_dir)
+    chat_prompt_templates = asyncio.run(factory.aget_chat_prompt_templates(['agent', 'critic', 'agent']))
+    assert list(chat_prompt_templates) == ['agent', 'critic']
+    assert chat_prompt_templates['agent'].messages[0] is factory.get_chat_prompt_template('agent').messages[0]
+
+
+def test_slots_reject_unknown_attributes(prompt_templates_dir: Path):
+    factory = BasePromptTemplateFactory(prompt_templates_dir)
+    assert not hasattr(factory, '__dict__')
+    with pytest.raises(AttributeError):
+        factory.unknown = 1
+
+
+class TestRegisterAndSpecialize:
+    def test_getter_matches_cached_template(self, prompt_templates_dir: Path):
+        factory = BasePromptTemplateFactory(prompt_templates_dir)
+        getters = factory.register_and_specialize(['agent'])
+        assert getters['agent']().messages[0] is factory.get_chat_prompt_template('agent').messages[0]
+
+    def test_getter_returns_copies(self, prompt_templates_dir: Path):
+        factory = BasePromptTemplateFactory(prompt_templates_dir)
+        getters = factory.register_and_specialize(['agent'])
+        getters['agent']().append(('human', '{{ question }}'))
+        assert len(getters['agent']().messages) == 2
+
+    def test_getter_reloads_after_clear(self, prompt_templates_dir: Path):
+        factory = BasePromptTemplateFactory(prompt_templates_dir)
+        getters = factory.register_and_specialize(['agent'])
+        first = getters['agent']()
+        factory.clear_cache()
+        assert getters['agent']().messages[0] is not first.messages[0]
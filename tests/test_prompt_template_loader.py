@@ -0,0 +1,171 @@
+"""
+PromptTemplateLoader的测试。
+"""
+
+from __future__ import annotations
+
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+from langchain_core.prompts import (
+    AIMessagePromptTemplate,
+    HumanMessagePromptTemplate,
+    MessagesPlaceholder,
+    SystemMessagePromptTemplate,
+)
+
+from prompt_management_methods import prompt_template_loader
+from prompt_management_methods.prompt_template_loader import PromptTemplateLoader, _fast_read_text
+
+
+def test_chat_prompt_template_reuses_loaded_message_prompt_template(prompt_templates_dir: Path):
+    path = prompt_templates_dir / 'system_message_prompt_template_agent.j2'
+    chat_prompt_template = PromptTemplateLoader.load_chat_prompt_template_from_j2(path)
+    system_message_prompt_template = PromptTemplateLoader.load_system_message_prompt_template_from_j2(path)
+    # 不经过template_format重新构建，直接使用已加载的对象。
+    assert chat_prompt_template.messages[0] is system_message_prompt_template
+    assert isinstance(chat_prompt_template.messages[0], SystemMessagePromptTemplate)
+    assert isinstance(chat_prompt_template.messages[1], MessagesPlaceholder)
+    assert sorted(chat_prompt_template.input_variables) == ['chat_history', 'role']
+
+
+def _touch_later(path: Path) -> None:
+    """
+    推后文件的mtime，避免文件系统的mtime精度导致修改不被识别。
+    """
+    stat = path.stat()
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+
+
+class TestTemplateCache:
+    def test_same_file_returns_cached_template(self, prompt_templates_dir: Path):
+        path = prompt_templates_dir / 'system_message_prompt_template_agent.j2'
+        first = PromptTemplateLoader.load_system_message_prompt_template_from_j2(path)
+        second = PromptTemplateLoader.load_system_message_prompt_template_from_j2(str(path))
+        assert first is second
+
+    def test_file_edit_reloads_and_replaces_entry(self, prompt_templates_dir: Path):
+        path = prompt_templates_dir / 'system_message_prompt_template_agent.j2'
+        first = PromptTemplateLoader.load_system_message_prompt_template_from_j2(path)
+        path.write_text('你是{{ name }}。', encoding='utf-8')
+        _touch_later(path)
+        second = PromptTemplateLoader.load_system_message_prompt_template_from_j2(path)
+        assert second is not first
+        assert second.input_variables == ['name']
+        assert len(prompt_template_loader._TEMPLATE_CACHE) == 1
+
+    def test_template_type_is_part_of_key(self, prompt_templates_dir: Path):
+        path = prompt_templates_dir / 'system_message_prompt_template_agent.j2'
+        system = PromptTemplateLoader.load_system_message_prompt_template_from_j2(path)
+        human = PromptTemplateLoader.load_human_message_prompt_template_from_j2(path)
+        assert type(system) is not type(human)
+
+    def test_clear_cache(self, prompt_templates_dir: Path):
+        path = prompt_templates_dir / 'system_message_prompt_template_agent.j2'
+        first = PromptTemplateLoader.load_system_message_prompt_template_from_j2(path)
+        PromptTemplateLoader.clear_cache()
+        assert PromptTemplateLoader.load_system_message_prompt_template_from_j2(path) is not first
+
+
+def test_fast_read_text_normalizes_newlines(tmp_path: Path):
+    path = tmp_path / 'crlf.j2'
+    path.write_bytes('第一行\r\n第二行\r第三行\n'.encode('utf-8'))
+    assert _fast_read_text(path) == path.read_text(encoding='utf-8') == '第一行\n第二行\n第三行\n'
+
+
+def test_prompt_caching_marks_system_message(prompt_templates_dir: Path):
+    path = prompt_templates_dir / 'system_message_prompt_template_agent.j2'
+    chat_prompt_template = PromptTemplateLoader.safe_load_chat_prompt_template_from_j2(
+        path, {'role': '助手'}, enable_prompt_caching=True,
+    )
+    assert chat_prompt_template.messages[0].content == [
+        {'type': 'text', 'text': '你是助手。', 'cache_control': {'type': 'ephemeral'}},
+    ]
+
+
+def test_prompt_caching_is_disabled_by_default(prompt_templates_dir: Path):
+    path = prompt_templates_dir / 'system_message_prompt_template_agent.j2'
+    chat_prompt_template = PromptTemplateLoader.safe_load_chat_prompt_template_from_j2(path, {'role': '助手'})
+    assert chat_prompt_template.messages[0].content == '你是助手。'
+
+
+@pytest.mark.parametrize(
+    ('message_type', 'message_prompt_template_class'),
+    [
+        ('system', SystemMessagePromptTemplate),
+        ('human', HumanMessagePromptTemplate),
+        ('ai', AIMessagePromptTemplate),
+    ],
+)
+def test_load_message_prompt_template_dispatch(
+    prompt_templates_dir: Path,
+    message_type: str,
+    message_prompt_template_class: type,
+):
+    message_prompt_template = PromptTemplateLoader.load_message_prompt_template_from_j2(
+        prompt_templates_dir / 'human_message_prompt_template_ask.j2',
+        message_type,
+    )
+    assert type(message_prompt_template) is message_prompt_template_class
+
+
+def test_unknown_message_type_raises(prompt_templates_dir: Path):
+    with pytest.raises(ValueError):
+        PromptTemplateLoader.load_message_prompt_template_from_j2(
+            prompt_templates_dir / 'human_message_prompt_template_ask.j2',
+            'tool',
+        )
+
+
+def test_fast_read_text_large_file(tmp_path: Path):
+    path = tmp_path / 'large.j2'
+    path.write_bytes('第一行\r\n第二行\n'.encode('utf-8') * 20000)
+    assert path.stat().st_size > prompt_template_loader._MMAP_THRESHOLD
+    assert _fast_read_text(path) == path.read_text(encoding='utf-8')
+    assert PromptTemplateLoader.load_original_txt(path) == path.read_text(encoding='utf-8')
+
+
+class TestFormatSystemMessage:
+    def test_str_values_are_cached(self, prompt_templates_dir: Path):
+        path = prompt_templates_dir / 'system_message_prompt_template_agent.j2'
+        PromptTemplateLoader.safe_load_chat_prompt_template_from_j2(path, {'role': '助手'})
+        PromptTemplateLoader.safe_load_chat_prompt_template_from_j2(path, {'role': '助手'})
+        assert len(prompt_template_loader._FORMAT_CACHE) == 1
+
+    def test_equal_non_str_values_are_not_shared(self, prompt_templates_dir: Path):
+        path = prompt_templates_dir / 'system_message_prompt_template_agent.j2'
+        contents = [
+            PromptTemplateLoader.safe_load_chat_prompt_template_from_j2(path, {'role': value}).messages[0].content
+            for value in (1, True, 1.0)
+        ]
+        assert contents == ['你是1。', '你是True。', '你是1.0。']
+        assert len(prompt_template_loader._FORMAT_CACHE) == 0
+
+    def test_returns_independent_messages(self, prompt_templates_dir: Path):
+        path = prompt_templates_dir / 'system_message_prompt_template_agent.j2'
+        first = PromptTemplateLoader.safe_load_chat_prompt_template_from_j2(path, {'role': '助手'}).messages[0]
+        first.id = 'changed'
+        second = PromptTemplateLoader.safe_load_chat_prompt_template_from_j2(path, {'role': '助手'}).messages[0]
+        assert second is not first
+        assert second.id is None
+
+    def test_clear_cache(self, prompt_templates_dir: Path):
+        path = prompt_templates_dir / 'system_message_prompt_template_agent.j2'
+        PromptTemplateLoader.safe_load_chat_prompt_template_from_j2(path, {'role': '助手'})
+        PromptTemplateLoader.clear_cache()
+        assert not prompt_template_loader._FORMAT_CACHE
+
+
+def test_load_original_txt_does_not_import_langchain(tmp_path: Path):
+    path = tmp_path / 'plain.txt'
+    path.write_text('纯文本', encoding='utf-8')
+    code = (
+        'import sys\n'
+        'from prompt_management_methods.prompt_template_loader import PromptTemplateLoader\n'
+        f'assert PromptTemplateLoader.load_original_txt({str(path)!r}) == "纯文本"\n'
+        'assert not any(name.startswith("langchain") for name in sys.modules)\n'
+    )
+    subprocess.run([sys.executable, '-c', code], check=True, cwd=Path(__file__).parent.parent)
@@ -0,0 +1,57 @@
+"""
+safe_format_message_prompt_template的测试。
+"""
+
+from __future__ import annotations
+
+import pytest
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.prompts import HumanMessagePromptTemplate
+
+from prompt_management_methods import safe_format_message_prompt_template as safe_format_module
+from prompt_management_methods.safe_format_message_prompt_template import safe_format_message_prompt_template
+
+
+def _human(template: str) -> HumanMessagePromptTemplate:
+    return HumanMessagePromptTemplate.from_template(template, template_format='jinja2')
+
+
+def test_formats_and_reuses_chat_prompt_template():
+    message_prompt_templates = [_human('问题: {{ question }}')]
+    first = safe_format_message_prompt_template(message_prompt_templates, {'question': 'a'})
+    second = safe_format_message_prompt_template(message_prompt_templates, {'question': 'b'})
+    assert [message.content for message in first + second] == ['问题: a', '问题: b']
+    assert len(safe_format_module._SAFE_FORMAT_CACHE) == 1
+
+
+def test_missing_variable_raises():
+    with pytest.raises(KeyError):
+        safe_format_message_prompt_template([_human('问题: {{ question }}')], {})
+
+
+def test_lists_with_messages_are_not_cached():
+    messages = safe_format_message_prompt_template(
+        [_human('问题: {{ question }}'), AIMessage('回答')],
+        {'question': 'a'},
+    )
+    assert [message.content for message in messages] == ['问题: a', '回答']
+    assert not safe_format_module._SAFE_FORMAT_CACHE
+
+
+def test_no_input_variables_skips_chat_prompt_template():
+    human_message = HumanMessage('你好')
+    messages = safe_format_message_prompt_template([human_message, _human('固定内容')], {})
+    assert messages[0] is human_message
+    assert messages[1].content == '固定内容'
+    assert not safe_format_module._SAFE_FORMAT_CACHE
+
+
+def test_message_like_tuples_are_accepted():
+    messages = safe_format_message_prompt_template([('human', '你好'), AIMessage('回答')], {})
+    assert [message.content for message in messages] == ['你好', '回答']
+    assert not safe_format_module._SAFE_FORMAT_CACHE
+
+
+def test_none_format_kwargs_raises_langchain_error():
+    with pytest.raises(TypeError, match='INVALID_PROMPT_INPUT'):
+        safe_format_message_prompt_template([AIMessage('回答')], None)